@@ -1,7 +1,12 @@
 import random
 import csv
+import math
+import os
+import sys
+import threading
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from statistics import NormalDist
 
 class Player:
     def __init__(self, name, serve_win_prob, ace_prob, double_fault_prob):
@@ -10,18 +15,228 @@ class Player:
         self.ace_prob = ace_prob
         self.double_fault_prob = double_fault_prob
 
+# Terminal transition codes. A state index >= 0 means the game, tiebreak or set
+# is still in progress; these codes mean player1 or player2 has just won it.
+PLAYER1_WINS = -1
+PLAYER2_WINS = -2
+
+MATCH_FORMATS = {
+    # 7-point tiebreak at 6-6 in every set, final set included
+    "standard": {"no_ad": False, "set_games": 6, "tiebreak_at": 6, "tiebreak_points": 7,
+                 "tiebreak_decider_at": None, "final_set": "set", "final_tiebreak_points": 7},
+    # 10-point tiebreak at 6-6 in the final set
+    "grand_slam": {"no_ad": False, "set_games": 6, "tiebreak_at": 6, "tiebreak_points": 7,
+                   "tiebreak_decider_at": None, "final_set": "set", "final_tiebreak_points": 10},
+    # Deciding point at deuce
+    "no_ad": {"no_ad": True, "set_games": 6, "tiebreak_at": 6, "tiebreak_points": 7,
+              "tiebreak_decider_at": None, "final_set": "set", "final_tiebreak_points": 7},
+    # 10-point match tiebreak played instead of the final set
+    "match_tiebreak": {"no_ad": False, "set_games": 6, "tiebreak_at": 6, "tiebreak_points": 7,
+                       "tiebreak_decider_at": None, "final_set": "match_tiebreak", "final_tiebreak_points": 10},
+    # First to 4 games with no-ad scoring and a 5-point tiebreak at 3-3, decided at 4-4
+    "fast4": {"no_ad": True, "set_games": 4, "tiebreak_at": 3, "tiebreak_points": 5,
+              "tiebreak_decider_at": 4, "final_set": "set", "final_tiebreak_points": 5},
+}
+
+def compile_race(target, decider_at=None):
+    """Compile a first-to-`target`, win-by-two race into a transition table.
+
+    Returns the (player1, player2) score of every state, the next state for
+    each point winner and the index of the decider state (-1 if none), from
+    which the next point wins outright. Level scores from target - 1 on
+    collapse onto a single deuce state so the table stays finite.
+    """
+    decider = (decider_at, decider_at)
+    states = [(0, 0)]
+    index = {(0, 0): 0}
+    transitions = []
+    i = 0
+    while i < len(states):
+        a, b = states[i]
+        if (a, b) == decider:
+            transitions.append((PLAYER1_WINS, PLAYER2_WINS))
+        else:
+            row = []
+            for (x, y), won in (((a + 1, b), PLAYER1_WINS), ((a, b + 1), PLAYER2_WINS)):
+                if max(x, y) >= target and abs(x - y) >= 2:
+                    row.append(won)
+                    continue
+                if x == y and x >= target - 1 and (x, y) != decider:
+                    x = y = target - 1
+                if (x, y) not in index:
+                    index[(x, y)] = len(states)
+                    states.append((x, y))
+                row.append(index[(x, y)])
+            transitions.append(tuple(row))
+        i += 1
+    return states, transitions, index.get(decider, -1)
+
+TENNIS_POINTS = {0: "0", 1: "15", 2: "30", 3: "40"}
+
+def game_label(server_points, receiver_points):
+    if server_points == receiver_points >= 3:
+        return "Deuce"
+    elif max(server_points, receiver_points) >= 4:
+        return "Ad-In" if server_points > receiver_points else "Ad-Out"
+    return f"{TENNIS_POINTS[server_points]}-{TENNIS_POINTS[receiver_points]}"
+
+class SetRules:
+    def __init__(self, games, tiebreak_at, tiebreak_points, tiebreak_decider_at):
+        _, self.set_next, self.tiebreak_state = compile_race(games, tiebreak_at)
+        _, self.tiebreak_next, _ = compile_race(tiebreak_points, tiebreak_decider_at)
+
+class ScoringRules:
+    """Integer state-transition tables compiled from a match format description."""
+    def __init__(self, description):
+        self.description = description
+        game_states, self.game_next, _ = compile_race(4, 3 if description["no_ad"] else None)
+        # Point score labels indexed by [game_state][server_index]
+        self.game_labels = [(game_label(a, b), game_label(b, a)) for a, b in game_states]
+        regular_set = SetRules(description["set_games"], description["tiebreak_at"],
+                               description["tiebreak_points"], description["tiebreak_decider_at"])
+        if description["final_set"] == "match_tiebreak":
+            # A one-game "set" that starts straight in the tiebreak
+            final_set = SetRules(1, 0, description["final_tiebreak_points"], None)
+        else:
+            final_set = SetRules(description["set_games"], description["tiebreak_at"],
+                                 description["final_tiebreak_points"], description["tiebreak_decider_at"])
+        # Indexed by is_final_set()
+        self.set_rules = (regular_set, final_set)
+
+_compiled_formats = {}
+
+def compile_format(match_format):
+    """Return the ScoringRules for a MATCH_FORMATS name or a format description dict.
+
+    Custom descriptions need every key of MATCH_FORMATS["standard"].
+    """
+    if isinstance(match_format, str):
+        if match_format not in MATCH_FORMATS:
+            raise ValueError(f"Unknown match format {match_format!r}, expected one of {sorted(MATCH_FORMATS)}")
+        description = MATCH_FORMATS[match_format]
+    else:
+        description = match_format
+    key = tuple(sorted(description.items()))
+    rules = _compiled_formats.get(key)
+    if rules is None:
+        missing = [name for name in MATCH_FORMATS["standard"] if name not in description]
+        if missing:
+            raise ValueError(f"Match format description is missing {', '.join(missing)}")
+        rules = _compiled_formats[key] = ScoringRules(description)
+    return rules
+
+# Tiebreak likelihood indexed by games played in the set, certain from 6-6 on
+TIEBREAK_PROBABILITIES = (0.1,) * 10 + (0.2, 0.5)
+
+class MatchupTerms:
+    """Per-matchup constants for the point probability kernel, indexed by server."""
+    def __init__(self, player1, player2):
+        self.serve_win = (player1.serve_win_prob, player2.serve_win_prob)
+        self.return_win = (1 - player1.serve_win_prob, 1 - player2.serve_win_prob)
+        self.ace = (player1.ace_prob, player2.ace_prob)
+
+def ace_probability(ace_prob, point_diff, server_won_last, consecutive_points, last_point_ace):
+    """Next-serve ace probability from the server's base ace rate."""
+    momentum = 0
+    if server_won_last:
+        momentum = 0.005 * consecutive_points
+        if momentum >= 0.02:
+            momentum = 0.02
+    adjusted_prob = ace_prob + 0.01 * point_diff + momentum + (0.02 if last_point_ace else 0)
+    # Cap at 30% to keep it realistic
+    return 0.3 if adjusted_prob >= 0.3 else 0 if adjusted_prob <= 0 else adjusted_prob
+
+def point_probabilities(terms, state):
+    """Fused kernel computing every logged probability for one match state.
+
+    `state` is the tuple built by TennisMatch.point_state(). Returns the match,
+    set, game and next-point win probabilities for player1 and player2, then the
+    next-serve ace and tiebreak probabilities. The calculate_* methods on
+    TennisMatch read their values from here.
+    """
+    (sets1, sets2, games1, games2, points1, points2, server_index, last_winner,
+     consecutive_points, last_point_ace, aces1, double_faults1, aces2, double_faults2) = state
+    # Clamps are written as conditionals rather than min/max calls; like the
+    # min/max clamps they replace, they return ints at the bounds
+    set_diff = sets1 - sets2
+    game_diff = games1 - games2
+    point_diff = points1 - points2
+    serve_win = terms.serve_win[server_index]
+    return_win = terms.return_win[server_index]
+
+    match1 = 0.5 + set_diff * 0.1 + game_diff * 0.01
+    match2 = 0.5 + -set_diff * 0.1 + -game_diff * 0.01
+    set1 = 0.5 + game_diff * 0.05
+    set2 = 0.5 + -game_diff * 0.05
+    server_game = serve_win + point_diff * 0.05
+    receiver_game = return_win + -point_diff * 0.05
+
+    # Momentum from consecutive points, positive for the last point winner
+    if last_winner == -1:
+        momentum1 = momentum2 = 0
+    else:
+        momentum = 0.01 * consecutive_points
+        if momentum >= 0.05:
+            momentum = 0.05
+        momentum1 = momentum if last_winner == 0 else -momentum
+        momentum2 = momentum if last_winner == 1 else -momentum
+    if server_index == 0:
+        game1, game2 = server_game, receiver_game
+        next1 = serve_win + 0.02 * point_diff + momentum1
+        next2 = return_win + -0.02 * point_diff + momentum2
+    else:
+        game1, game2 = receiver_game, server_game
+        next1 = return_win + -0.02 * point_diff + momentum1
+        next2 = serve_win + 0.02 * point_diff + momentum2
+    next1 = next1 + (0.03 if aces1 else 0) + (-0.03 if double_faults1 else 0)
+    next2 = next2 + (0.03 if aces2 else 0) + (-0.03 if double_faults2 else 0)
+
+    games_sum = games1 + games2
+
+    return (0 if match1 < 0 else 1 if match1 > 1 else match1,
+            0 if match2 < 0 else 1 if match2 > 1 else match2,
+            0 if set1 < 0 else 1 if set1 > 1 else set1,
+            0 if set2 < 0 else 1 if set2 > 1 else set2,
+            0 if game1 < 0 else 1 if game1 > 1 else game1,
+            0 if game2 < 0 else 1 if game2 > 1 else game2,
+            1 if next1 >= 1 else 0 if next1 <= 0 else next1,
+            1 if next2 >= 1 else 0 if next2 <= 0 else next2,
+            ace_probability(terms.ace[server_index], point_diff, last_winner == server_index,
+                            consecutive_points, last_point_ace),
+            TIEBREAK_PROBABILITIES[games_sum] if games_sum < 12 else 1.0)
+
 class TennisMatch:
-    def __init__(self, player1, player2, best_of=3, grand_slam=True):
+    # match_format takes precedence over grand_slam, which only picks between
+    # the "grand_slam" and "standard" formats when no match_format is given
+    def __init__(self, player1, player2, best_of=3, grand_slam=True, point_tilt=None, match_format=None, log_points=True, rng=None, keep_states=False):
         self.player1 = player1
         self.player2 = player2
         self.best_of = best_of
         self.grand_slam = grand_slam
+        if match_format is None:
+            match_format = "grand_slam" if grand_slam else "standard"
+        self.rules = compile_format(match_format)
+        self.set_rules = None
+        self.game_state = 0
+        self.set_state = 0
+        self.tiebreak_state = 0
+        self.log_points = log_points
+        # Kernel input for every logged point, kept only for recompute_point_log
+        self.keep_states = keep_states
+        self.rng = rng if rng is not None else random
+        self.point_tilt = point_tilt
+        self.likelihood_ratio = 1.0
         self.server = None
         self.receiver = None
         self.score = {"sets": [0, 0], "games": [0, 0], "points": [0, 0]}
         self.set_history = []
+        self.set_scores = []
         self.total_shots = 0
         self.point_log = []
+        self.point_states = []
+        self.terms = MatchupTerms(player1, player2)
+        self.probability_fields = tuple(f"{name}_{field}" for field in ("match_win_prob", "set_win_prob", "game_win_prob", "next_point_win_prob")
+                                        for name in (player1.name, player2.name)) + ("next_serve_ace_prob", "tiebreak_prob")
         self.stats = {player1.name: {"aces": 0, "double_faults": 0},
                       player2.name: {"aces": 0, "double_faults": 0}}
         self.last_point_winner = None
@@ -37,37 +252,11 @@ class TennisMatch:
     def is_final_set(self):
         return sum(self.score["sets"]) == self.best_of - 1
 
-    def is_set_over(self):
-        if not self.is_tiebreak:
-            return (max(self.score["games"]) >= 6 and abs(self.score["games"][0] - self.score["games"][1]) >= 2)
-        else:
-            if self.grand_slam and self.is_final_set():
-                return (max(self.score["points"]) >= 10 and abs(self.score["points"][0] - self.score["points"][1]) >= 2)
-            else:
-                return (max(self.score["points"]) >= 7 and abs(self.score["points"][0] - self.score["points"][1]) >= 2)
-
     def format_point_score(self):
-        if not self.is_tiebreak:
-            server_points = self.score["points"][0 if self.server == self.player1 else 1]
-            receiver_points = self.score["points"][1 if self.server == self.player1 else 0]
-            if server_points == receiver_points >= 3:
-                return "Deuce"
-            elif max(server_points, receiver_points) >= 4:
-                if abs(server_points - receiver_points) == 1:
-                    return "Ad-In" if server_points > receiver_points else "Ad-Out"
-                elif abs(server_points - receiver_points) >= 2:
-                    return "GAME"
-            else:
-                return f"{self.point_to_tennis_score(server_points)}-{self.point_to_tennis_score(receiver_points)}"
-        else:
-            server_points = self.score["points"][0 if self.server == self.player1 else 1]
-            receiver_points = self.score["points"][1 if self.server == self.player1 else 0]
-            return f"{server_points}-{receiver_points}"
-
-    def point_to_tennis_score(self, points):
+        server_index = 0 if self.server == self.player1 else 1
         if self.is_tiebreak:
-            return str(points)
-        return {0: "0", 1: "15", 2: "30", 3: "40"}.get(points, str(points))
+            return f"{self.score['points'][server_index]}-{self.score['points'][1 - server_index]}"
+        return self.rules.game_labels[self.game_state][server_index]
 
     def format_game_score(self):
         server_games = self.score["games"][0 if self.server == self.player1 else 1]
@@ -79,86 +268,111 @@ class TennisMatch:
         receiver_sets = self.score['sets'][1 if self.server == self.player1 else 0]
         return f"{server_sets}-{receiver_sets}"
 
-    def log_point(self):
-        point_score = self.format_point_score()
-        game_over = False
-        set_over = False
-        
+    def start_tiebreak(self):
+        self.is_tiebreak = True
+        self.score["points"] = [0, 0]  # Reset points for tiebreak
+        self.tiebreak_state = 0
+        self.tiebreak_server = self.server
+        self.tiebreak_points = 0
+
+    def score_point(self, winner):
+        # Step the game (or tiebreak) table, then the set table when it completes
+        winner_index = 0 if winner == self.player1 else 1
         if self.is_tiebreak:
-            if self.is_set_over():
-                set_over = True
-                game_over = True
-                point_score = "SET"
-                winning_player_index = 0 if self.score["points"][0] > self.score["points"][1] else 1
-                self.score["games"][winning_player_index] += 1
-                self.score["sets"][winning_player_index] += 1
-                self.is_tiebreak = False
+            self.tiebreak_state = self.set_rules.tiebreak_next[self.tiebreak_state][winner_index]
+            if self.tiebreak_state >= 0:
+                return False, False
         else:
-            if point_score == "GAME":
-                game_over = True
-                winning_player_index = 0 if self.score["points"][0] > self.score["points"][1] else 1
-                self.score["games"][winning_player_index] += 1
-            
-            if self.is_set_over():
-                set_over = True
-                point_score = "SET"
-                winning_player_index = 0 if self.score["games"][0] > self.score["games"][1] else 1
-                self.score["sets"][winning_player_index] += 1
-            elif self.score["games"][0] == 6 and self.score["games"][1] == 6:
-                self.is_tiebreak = True
-                self.score["points"] = [0, 0]  # Reset points for tiebreak
-                self.tiebreak_server = self.server
-                self.tiebreak_points = 0
-
-        game_score = self.format_game_score()
-        set_score = self.format_set_score()
-        
-        # Calculate probabilities (implementation of these methods remains the same)
-        match_win_prob1 = self.calculate_match_win_probability(self.player1)
-        match_win_prob2 = self.calculate_match_win_probability(self.player2)
-        set_win_prob1 = self.calculate_set_win_probability(self.player1)
-        set_win_prob2 = self.calculate_set_win_probability(self.player2)
-        game_win_prob1 = self.calculate_game_win_probability(self.player1)
-        game_win_prob2 = self.calculate_game_win_probability(self.player2)
-        next_point_prob1 = self.calculate_next_point_win_probability(self.player1)
-        next_point_prob2 = self.calculate_next_point_win_probability(self.player2)
-        ace_prob = self.calculate_ace_probability()
-        tiebreak_prob = self.calculate_tiebreak_probability()
+            self.game_state = self.rules.game_next[self.game_state][winner_index]
+            if self.game_state >= 0:
+                return False, False
+
+        self.score["games"][winner_index] += 1
+        self.set_state = self.set_rules.set_next[self.set_state][winner_index]
+        if self.set_state < 0:
+            self.score["sets"][winner_index] += 1
+            return True, True
+        if self.set_state == self.set_rules.tiebreak_state:
+            self.start_tiebreak()
+        return True, False
+
+    def log_point(self, game_over, set_over):
+        if set_over:
+            point_score = "SET"
+        elif game_over:
+            point_score = "GAME"
+        else:
+            point_score = self.format_point_score()
 
-        self.point_log.append({
+        state = self.point_state()
+        if self.keep_states:
+            self.point_states.append(state)
+        entry = {
             "server": self.server.name,
             "receiver": self.receiver.name,
             "point_score": point_score,
-            "game_score": game_score,
-            "set_score": set_score,
-            f"{self.player1.name}_match_win_prob": match_win_prob1,
-            f"{self.player2.name}_match_win_prob": match_win_prob2,
-            f"{self.player1.name}_set_win_prob": set_win_prob1,
-            f"{self.player2.name}_set_win_prob": set_win_prob2,
-            f"{self.player1.name}_game_win_prob": game_win_prob1,
-            f"{self.player2.name}_game_win_prob": game_win_prob2,
-            f"{self.player1.name}_next_point_win_prob": next_point_prob1,
-            f"{self.player2.name}_next_point_win_prob": next_point_prob2,
-            "next_serve_ace_prob": ace_prob,
-            "tiebreak_prob": tiebreak_prob
-        })
-
-        return game_over, set_over
+            "game_score": self.format_game_score(),
+            "set_score": self.format_set_score(),
+        }
+        entry.update(zip(self.probability_fields, point_probabilities(self.terms, state)))
+        self.point_log.append(entry)
+
+    def point_state(self):
+        stats1 = self.stats[self.player1.name]
+        stats2 = self.stats[self.player2.name]
+        if self.last_point_winner is None:
+            last_winner = -1
+        else:
+            last_winner = 0 if self.last_point_winner == self.player1 else 1
+        return (self.score["sets"][0], self.score["sets"][1],
+                self.score["games"][0], self.score["games"][1],
+                self.score["points"][0], self.score["points"][1],
+                0 if self.server == self.player1 else 1, last_winner,
+                self.consecutive_points, self.last_point_ace,
+                stats1["aces"] > 0, stats1["double_faults"] > 0,
+                stats2["aces"] > 0, stats2["double_faults"] > 0)
+
+    def recompute_point_log(self, terms=None):
+        """Recompute the probability fields of the whole point log from its stored states.
+
+        Pass `terms` built from different Player parameters to re-price the
+        stored points under another model. Needs the match to be created with
+        keep_states=True.
+        """
+        if not self.keep_states:
+            raise ValueError("recompute_point_log needs a TennisMatch created with keep_states=True")
+        terms = terms or self.terms
+        for entry, state in zip(self.point_log, self.point_states):
+            entry.update(zip(self.probability_fields, point_probabilities(terms, state)))
+
+    def draw(self, prob, tilt):
+        # Bernoulli draw from the tilted probability; the likelihood ratio keeps
+        # estimates taken under the tilt unbiased for the untilted model
+        if tilt == 0:
+            return self.rng.random() < prob
+        tilted_prob = tilt_probability(prob, tilt)
+        if self.rng.random() < tilted_prob:
+            self.likelihood_ratio *= prob / tilted_prob
+            return True
+        self.likelihood_ratio *= (1 - prob) / (1 - tilted_prob)
+        return False
 
     def play_point(self):
         self.total_shots += 1
+        # Positive tilt favours the server, negative favours the receiver
+        tilt = self.point_tilt(self) if self.point_tilt is not None else 0
         ace_prob = self.calculate_ace_probability()
-        if random.random() < ace_prob:
+        if self.draw(ace_prob, tilt):
             self.stats[self.server.name]["aces"] += 1
             self.score["points"][0 if self.server == self.player1 else 1] += 1
             winner = self.server
             self.last_point_ace = True
-        elif random.random() < self.server.double_fault_prob:
+        elif self.draw(self.server.double_fault_prob, -tilt):
             self.stats[self.server.name]["double_faults"] += 1
             self.score["points"][1 if self.server == self.player1 else 0] += 1
             winner = self.receiver
             self.last_point_ace = False
-        elif random.random() < self.server.serve_win_prob:
+        elif self.draw(self.server.serve_win_prob, tilt):
             self.score["points"][0 if self.server == self.player1 else 1] += 1
             winner = self.server
             self.last_point_ace = False
@@ -183,6 +397,7 @@ class TennisMatch:
     def play_game(self):
         if not self.is_tiebreak:
             self.score["points"] = [0, 0]
+            self.game_state = 0
         self.last_point_winner = None
         self.consecutive_points = 0
         self.last_point_ace = False
@@ -191,8 +406,10 @@ class TennisMatch:
         
         while True:
             winner = self.play_point()
-            game_over, set_over = self.log_point()
-            if game_over or set_over:
+            game_over, set_over = self.score_point(winner)
+            if self.log_points:
+                self.log_point(game_over, set_over)
+            if game_over:
                 if not set_over and not self.is_tiebreak:
                     self.switch_server()
                 return winner, set_over
@@ -200,6 +417,10 @@ class TennisMatch:
     def play_set(self):
         set_stats = {self.player1.name: {"aces": 0, "double_faults": 0},
                      self.player2.name: {"aces": 0, "double_faults": 0}}
+        self.set_rules = self.rules.set_rules[self.is_final_set()]
+        self.set_state = 0
+        if self.set_rules.tiebreak_state == 0:
+            self.start_tiebreak()
         while True:
             winner, set_over = self.play_game()
             if set_over:
@@ -209,6 +430,9 @@ class TennisMatch:
                     self.stats[player]["aces"] = 0
                     self.stats[player]["double_faults"] = 0
                 self.set_history.append(set_stats)
+                games = tuple(self.score["games"])
+                tiebreak = tuple(self.score["points"]) if self.is_tiebreak else None
+                self.set_scores.append({"games": games, "tiebreak": tiebreak})
                 self.score["games"] = [0, 0]
                 self.score["points"] = [0, 0]
                 self.is_tiebreak = False
@@ -217,7 +441,7 @@ class TennisMatch:
                 return winner
 
     def play_match(self):
-        self.server = random.choice([self.player1, self.player2])
+        self.server = self.rng.choice([self.player1, self.player2])
         self.receiver = self.player2 if self.server == self.player1 else self.player1
 
         while max(self.score["sets"]) < (self.best_of // 2 + 1):
@@ -226,97 +450,139 @@ class TennisMatch:
         return self.player1 if self.score["sets"][0] > self.score["sets"][1] else self.player2
 
     def calculate_match_win_probability(self, player):
-        sets_to_win = self.best_of // 2 + 1
-        player_sets = self.score["sets"][0] if player == self.player1 else self.score["sets"][1]
-        opponent_sets = self.score["sets"][1] if player == self.player1 else self.score["sets"][0]
-        player_games = self.score["games"][0] if player == self.player1 else self.score["games"][1]
-        opponent_games = self.score["games"][1] if player == self.player1 else self.score["games"][0]
-        
-        base_prob = 0.5 + (player_sets - opponent_sets) * 0.1
-        game_adjustment = (player_games - opponent_games) * 0.01
-        return min(max(base_prob + game_adjustment, 0), 1)
+        return point_probabilities(self.terms, self.point_state())[0 if player == self.player1 else 1]
 
     def calculate_set_win_probability(self, player):
-        player_games = self.score["games"][0] if player == self.player1 else self.score["games"][1]
-        opponent_games = self.score["games"][1] if player == self.player1 else self.score["games"][0]
-        
-        base_prob = 0.5 + (player_games - opponent_games) * 0.05
-        return min(max(base_prob, 0), 1)
+        return point_probabilities(self.terms, self.point_state())[2 if player == self.player1 else 3]
 
     def calculate_game_win_probability(self, player):
-        is_server = player == self.server
-        player_points = self.score["points"][0] if is_server else self.score["points"][1]
-        opponent_points = self.score["points"][1] if is_server else self.score["points"][0]
-        
-        if is_server:
-            base_prob = self.server.serve_win_prob
-        else:
-            base_prob = 1 - self.server.serve_win_prob
-        
-        point_adjustment = (player_points - opponent_points) * 0.05
-        return min(max(base_prob + point_adjustment, 0), 1)
+        return point_probabilities(self.terms, self.point_state())[4 if player == self.player1 else 5]
 
     def calculate_next_point_win_probability(self, player):
-        base_prob = self.server.serve_win_prob if player == self.server else 1 - self.server.serve_win_prob
-        
-        # Adjust for current score
-        score_diff = self.score["points"][0] - self.score["points"][1]
-        if player == self.server:
-            score_adjustment = 0.02 * score_diff
-        else:
-            score_adjustment = -0.02 * score_diff
-        
-        # Adjust for momentum (consecutive points won)
-        momentum_adjustment = 0
-        if self.last_point_winner == player:
-            momentum_adjustment = min(0.05, 0.01 * self.consecutive_points)
-        elif self.last_point_winner is not None:
-            momentum_adjustment = -min(0.05, 0.01 * self.consecutive_points)
-        
-        # Adjust for recent ace or double fault
-        recent_ace_adjustment = 0.03 if self.stats[player.name]["aces"] > 0 else 0
-        recent_df_adjustment = -0.03 if self.stats[player.name]["double_faults"] > 0 else 0
-        
-        # Combine all adjustments
-        adjusted_prob = base_prob + score_adjustment + momentum_adjustment + recent_ace_adjustment + recent_df_adjustment
-        
-        # Ensure probability is between 0 and 1
-        return max(0, min(1, adjusted_prob))
-    
+        return point_probabilities(self.terms, self.point_state())[6 if player == self.player1 else 7]
+
     def calculate_ace_probability(self):
-        base_prob = self.server.ace_prob
-        
-        # Adjust for current score
-        score_diff = self.score["points"][0] - self.score["points"][1]
-        score_adjustment = 0.01 * score_diff
-        
-        # Adjust for momentum (consecutive points won by server)
-        momentum_adjustment = 0
-        if self.last_point_winner == self.server:
-            momentum_adjustment = min(0.02, 0.005 * self.consecutive_points)
-        
-        # Adjust for recent ace
-        recent_ace_adjustment = 0.02 if self.last_point_ace else 0
-        
-        # Combine all adjustments
-        adjusted_prob = base_prob + score_adjustment + momentum_adjustment + recent_ace_adjustment
-        
-        # Ensure probability is between 0 and 1
-        return max(0, min(0.3, adjusted_prob))  # Cap at 30% to keep it realistic
+        # Called on every point, so skip the full kernel and use the ace term alone
+        return ace_probability(self.terms.ace[0 if self.server == self.player1 else 1],
+                               self.score["points"][0] - self.score["points"][1],
+                               self.last_point_winner == self.server,
+                               self.consecutive_points, self.last_point_ace)
 
     def calculate_tiebreak_probability(self):
-        games_sum = sum(self.score["games"])
-        if games_sum < 10:
-            return 0.1
-        elif games_sum == 10:
-            return 0.2
-        elif games_sum == 11:
-            return 0.5
+        return point_probabilities(self.terms, self.point_state())[9]
+
+def tilt_probability(prob, tilt):
+    """Exponentially tilt a probability by `tilt` on the log-odds scale."""
+    if prob <= 0 or prob >= 1:
+        return prob
+    weighted = prob * math.exp(tilt)
+    return weighted / (weighted + 1 - prob)
+
+def bagel_set_tilt(player=None, strength=0.6):
+    """Point tilt pushing the current set towards a 6-0 for `player`.
+
+    With `player=None` the tilt follows whichever player is still on course
+    for a bagel. Once both players hold a game in the set the tilt is dropped,
+    and once the bagel has happened the rest of the match is left untilted.
+    The default strength is tuned for "any 6-0 set" in best-of-3 between
+    evenly matched players; from about 1.0 up the weights degenerate.
+    """
+    def tilt(match):
+        for set_score in match.set_scores:
+            games = set_score["games"]
+            if 0 in games and set_score["tiebreak"] is None:
+                if player is None or games[0 if player == match.player1 else 1] > 0:
+                    return 0
+        games = match.score["games"]
+        if player is None:
+            if games[0] == games[1] or min(games) > 0:
+                return 0
+            leader = match.player1 if games[0] > games[1] else match.player2
         else:
-            return 1.0  # Tiebreak is certain at 6-6
+            leader = player
+            if games[1 if leader == match.player1 else 0] > 0:
+                return 0
+        return strength if match.server == leader else -strength
+    return tilt
+
+def long_tiebreak_tilt(strength=0.25):
+    """Point tilt keeping the final set level so its tiebreak runs long.
+
+    Favours whoever trails in games during the final set and whoever trails
+    in points during the final-set tiebreak. The default strength is tuned for
+    a grand-slam (10-point) final-set tiebreak reaching 20+ points in best-of-5;
+    it gives no gain for shorter tails such as 14+ points.
+    """
+    def tilt(match):
+        if not match.is_final_set():
+            return 0
+        score = match.score["points"] if match.is_tiebreak else match.score["games"]
+        if score[0] == score[1]:
+            return 0
+        server_index = 0 if match.server == match.player1 else 1
+        return strength if score[server_index] < score[1 - server_index] else -strength
+    return tilt
+
+def bagel_set_occurred(match):
+    return any(0 in set_score["games"] and set_score["tiebreak"] is None for set_score in match.set_scores)
+
+def final_set_tiebreak_reaches(min_points=20):
+    def event(match):
+        if len(match.set_scores) < match.best_of:
+            return False
+        tiebreak = match.set_scores[-1]["tiebreak"]
+        return tiebreak is not None and sum(tiebreak) >= min_points
+    return event
+
+# A rare-event estimate is flagged when its effective sample size drops below
+# this many hits, or below this fraction of the hits actually observed
+MIN_EFFECTIVE_HITS = 30
+MIN_EFFECTIVE_HIT_FRACTION = 0.05
+
+def simulate_rare_event(player1, player2, event, tilt=None, best_of=3, grand_slam=False, num_simulations=10000, match_format=None):
+    """Importance-sampling estimate of P(event) over simulated matches.
+
+    Matches are played under `tilt` and every hit is weighted by the match
+    likelihood ratio, so the estimate is unbiased for the untilted model.
+    When a few heavy weights dominate (see MIN_EFFECTIVE_HITS) the result is
+    marked "low_effective_sample_size" and its std_error cannot be trusted;
+    weaken the tilt or compare against tilt=None.
+    """
+    if num_simulations < 1:
+        raise ValueError(f"num_simulations must be at least 1, got {num_simulations}")
+    weighted_sum = 0.0
+    weighted_sq_sum = 0.0
+    hits = 0
 
-def simulate_single_match(player1, player2, best_of=3, grand_slam=False):
-    match = TennisMatch(player1, player2, best_of, grand_slam=grand_slam)
+    start_time = time.perf_counter()
+
+    for _ in range(num_simulations):
+        match = TennisMatch(player1, player2, best_of, grand_slam=grand_slam, point_tilt=tilt,
+                            match_format=match_format, log_points=False)
+        match.play_match()
+        if event(match):
+            hits += 1
+            weighted_sum += match.likelihood_ratio
+            weighted_sq_sum += match.likelihood_ratio ** 2
+
+    end_time = time.perf_counter()
+    execution_time = (end_time - start_time) * 1000  # Convert to milliseconds
+
+    estimate = weighted_sum / num_simulations
+    variance = max(weighted_sq_sum / num_simulations - estimate ** 2, 0)
+    std_error = math.sqrt(variance / (num_simulations - 1)) if num_simulations > 1 else float("nan")
+    effective_sample_size = weighted_sum ** 2 / weighted_sq_sum if weighted_sq_sum > 0 else 0
+
+    return {"estimate": estimate,
+            "std_error": std_error,
+            "hits": hits,
+            "effective_sample_size": effective_sample_size,
+            "low_effective_sample_size": effective_sample_size < max(MIN_EFFECTIVE_HITS, MIN_EFFECTIVE_HIT_FRACTION * hits),
+            "num_simulations": num_simulations,
+            "execution_time": execution_time}
+
+def simulate_single_match(player1, player2, best_of=3, grand_slam=False, match_format=None):
+    match = TennisMatch(player1, player2, best_of, grand_slam=grand_slam, match_format=match_format)
     winner = match.play_match()
     total_shots = match.total_shots
     point_log = match.point_log
@@ -329,7 +595,21 @@ def simulate_single_match(player1, player2, best_of=3, grand_slam=False):
 
     return winner.name, total_shots, point_log, aces, double_faults
 
-def simulate_batch(player1, player2, best_of, grand_slam=False, batch_size=10, save_logs=False, filename="match_log_parallel.csv"):
+_worker_state = threading.local()
+_log_lock = threading.Lock()
+
+def worker_rng():
+    """Random generator owned by the calling worker thread (and process)."""
+    pid = os.getpid()
+    # Forked workers inherit the parent's generator, so reseed on a new pid
+    if getattr(_worker_state, "pid", None) != pid:
+        _worker_state.rng = random.Random()
+        _worker_state.pid = pid
+    return _worker_state.rng
+
+def simulate_batch(player1, player2, best_of, grand_slam=False, batch_size=10, save_logs=False, filename="match_log_parallel.csv", match_format=None, rng=None):
+    if rng is None:
+        rng = worker_rng()
     match_wins = {player1.name: 0, player2.name: 0}
     total_shots = 0
     all_point_logs = []
@@ -337,7 +617,8 @@ def simulate_batch(player1, player2, best_of, grand_slam=False, batch_size=10, s
     total_double_faults = {player1.name: 0, player2.name: 0}
     
     for _ in range(batch_size):
-        match = TennisMatch(player1, player2, best_of, grand_slam=grand_slam)
+        match = TennisMatch(player1, player2, best_of, grand_slam=grand_slam,
+                            match_format=match_format, log_points=save_logs, rng=rng)
         winner = match.play_match()
         match_wins[winner.name] += 1
         total_shots += match.total_shots
@@ -348,7 +629,7 @@ def simulate_batch(player1, player2, best_of, grand_slam=False, batch_size=10, s
             total_double_faults[player] += sum(set_stats[player]["double_faults"] for set_stats in match.set_history)
     
     if save_logs:
-        with open(filename, 'a', newline='') as csvfile:
+        with _log_lock, open(filename, 'a', newline='') as csvfile:
             fieldnames = all_point_logs[0].keys() if all_point_logs else []
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             if csvfile.tell() == 0:
@@ -358,31 +639,186 @@ def simulate_batch(player1, player2, best_of, grand_slam=False, batch_size=10, s
     
     return match_wins, total_shots, total_aces, total_double_faults
 
-def simulate_match_parallel(player1, player2, best_of=3, grand_slam=False, num_simulations=1000, max_workers=4, batch_size=10, log_interval=100):
+class InlineExecutor:
+    """Executor that runs each submitted call immediately in the calling thread."""
+    def __init__(self, max_workers=None):
+        pass
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+EXECUTOR_BACKENDS = {
+    "process": ProcessPoolExecutor,
+    "thread": ThreadPoolExecutor,
+    "inline": InlineExecutor,
+}
+
+def gil_enabled():
+    # sys._is_gil_enabled only exists from 3.13; older interpreters always hold the GIL
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+def select_executor(executor="auto", max_workers=4, num_batches=None):
+    """Resolve an executor backend name, picking the fastest one for "auto".
+
+    Threads are only worth it when the GIL is disabled (free-threaded builds);
+    otherwise processes win unless there is nothing to run in parallel,
+    either because of the workload or because only one CPU is available.
+    """
+    if executor != "auto":
+        if executor not in EXECUTOR_BACKENDS:
+            raise ValueError(f"Unknown executor {executor!r}, expected one of {sorted(EXECUTOR_BACKENDS)} or 'auto'")
+        return executor
+    # Workers beyond the CPU count cannot run in parallel
+    max_workers = min(max_workers, os.cpu_count() or 1)
+    if max_workers <= 1 or (num_batches is not None and num_batches <= 1):
+        return "inline"
+    if not gil_enabled():
+        return "thread"
+    return "process"
+
+def create_executor(backend, max_workers=4):
+    """Create the executor for `backend`, returning it with the backend actually used.
+
+    Falls back to threads on platforms where process pools are unavailable.
+    """
+    try:
+        return EXECUTOR_BACKENDS[backend](max_workers=max_workers), backend
+    except (NotImplementedError, OSError, ImportError):
+        if backend != "process":
+            raise
+        return ThreadPoolExecutor(max_workers=max_workers), "thread"
+
+def wilson_interval(wins, n, confidence=0.95):
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = wins / n
+    denominator = 1 + z ** 2 / n
+    centre = (p + z ** 2 / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+    return max(centre - margin, 0.0), min(centre + margin, 1.0)
+
+def stream_match_parallel(player1, player2, best_of=3, grand_slam=False, num_simulations=1000, max_workers=4, batch_size=10, log_interval=100, match_format=None, executor="auto", confidence=0.95, cancel_event=None):
+    """Run simulate_match_parallel incrementally, yielding running estimates.
+
+    A progress dict is yielded every time batches complete, holding the win
+    probabilities so far with their confidence intervals, throughput and ETA.
+    Setting `cancel_event` (a threading.Event) stops the run after the batches
+    already in flight and yields a final update with "cancelled" set. Closing
+    the generator early cancels the batches that have not started and waits
+    for the running ones, so no CSV log writes arrive after it returns; the
+    last update it yielded holds the partial results.
+    """
     match_wins = {player1.name: 0, player2.name: 0}
     total_shots = 0
     total_aces = {player1.name: 0, player2.name: 0}
     total_double_faults = {player1.name: 0, player2.name: 0}
-    
+    num_batches = num_simulations // batch_size
+    completed = 0
+    cancelled = False
+
     start_time = time.perf_counter()
-    
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for i in range(num_simulations // batch_size):
-            save_logs = ((i + 1) * batch_size) % log_interval == 0
-            futures.append(executor.submit(simulate_batch, player1, player2, best_of, grand_slam, batch_size, save_logs))
-        
-        for future in as_completed(futures):
-            batch_match_wins, batch_shots, batch_aces, batch_double_faults = future.result()
-            for player in [player1.name, player2.name]:
-                match_wins[player] += batch_match_wins[player]
-                total_aces[player] += batch_aces[player]
-                total_double_faults[player] += batch_double_faults[player]
-            total_shots += batch_shots
-    
+
+    pool, backend = create_executor(select_executor(executor, max_workers, num_batches), max_workers)
+    # Keep only a few batches in flight so updates arrive early and cancelling is cheap
+    window = 1 if backend == "inline" else 2 * max_workers
+    pending = set()
+    next_batch = 0
+
+    def progress(finished):
+        elapsed = time.perf_counter() - start_time
+        matches_per_sec = completed / elapsed if elapsed > 0 else 0.0
+        remaining = 0 if cancelled else num_batches * batch_size - completed
+        return {
+            "completed": completed,
+            "num_simulations": num_batches * batch_size,
+            "match_wins": dict(match_wins),
+            "win_probability": {player: wins / completed if completed else float("nan")
+                                for player, wins in match_wins.items()},
+            "confidence_interval": {player: wilson_interval(wins, completed, confidence) for player, wins in match_wins.items()},
+            "matches_per_sec": matches_per_sec,
+            "elapsed": elapsed,
+            "eta": remaining / matches_per_sec if matches_per_sec > 0 else float("inf"),
+            "total_shots": total_shots,
+            "aces": dict(total_aces),
+            "double_faults": dict(total_double_faults),
+            "backend": backend,
+            "done": finished,
+            "cancelled": cancelled,
+        }
+
+    try:
+        while (next_batch < num_batches and not cancelled) or pending:
+            if cancel_event is not None and cancel_event.is_set() and not cancelled:
+                cancelled = True
+                pending = {future for future in pending if not future.cancel()}
+            while not cancelled and next_batch < num_batches and len(pending) < window:
+                save_logs = ((next_batch + 1) * batch_size) % log_interval == 0
+                pending.add(pool.submit(simulate_batch, player1, player2, best_of, grand_slam, batch_size, save_logs,
+                                        match_format=match_format))
+                next_batch += 1
+            if not pending:
+                # Cancelled with nothing in flight (always the case inline), so
+                # nothing below will yield the final update
+                if cancelled:
+                    yield progress(True)
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_match_wins, batch_shots, batch_aces, batch_double_faults = future.result()
+                for player in [player1.name, player2.name]:
+                    match_wins[player] += batch_match_wins[player]
+                    total_aces[player] += batch_aces[player]
+                    total_double_faults[player] += batch_double_faults[player]
+                total_shots += batch_shots
+                completed += batch_size
+
+            yield progress(not pending and (cancelled or next_batch == num_batches))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def simulate_match_parallel(player1, player2, best_of=3, grand_slam=False, num_simulations=1000, max_workers=4, batch_size=10, log_interval=100, match_format=None, executor="auto", return_backend=False):
+    """Returns (match_wins, total_shots, execution_time, aces, double_faults),
+    with the executor backend that ran appended when `return_backend` is set.
+    """
+    match_wins = {player1.name: 0, player2.name: 0}
+    total_shots = 0
+    total_aces = {player1.name: 0, player2.name: 0}
+    total_double_faults = {player1.name: 0, player2.name: 0}
+    backend = select_executor(executor, max_workers, num_simulations // batch_size)
+
+    start_time = time.perf_counter()
+
+    for update in stream_match_parallel(player1, player2, best_of, grand_slam, num_simulations, max_workers,
+                                        batch_size, log_interval, match_format, executor):
+        match_wins = update["match_wins"]
+        total_shots = update["total_shots"]
+        total_aces = update["aces"]
+        total_double_faults = update["double_faults"]
+        backend = update["backend"]
+
+    # Measured once the stream is drained, so pool shutdown is included
     end_time = time.perf_counter()
     execution_time = (end_time - start_time) * 1000  # Convert to milliseconds
-    
+
+    if return_backend:
+        return match_wins, total_shots, execution_time, total_aces, total_double_faults, backend
     return match_wins, total_shots, execution_time, total_aces, total_double_faults
 
 
@@ -397,21 +833,22 @@ if __name__ == "__main__":
     player1 = Player("Federer", serve_win_prob=0.65, ace_prob=0.10, double_fault_prob=0.05)
     player2 = Player("Nadal", serve_win_prob=0.62, ace_prob=0.08, double_fault_prob=0.04)
 
-    results, total_shots, execution_time, aces, double_faults = simulate_match_parallel(player1, 
-                                                                                        player2, 
-                                                                                        best_of=num_sets, 
-                                                                                        grand_slam=True,
-                                                                                        num_simulations=num_simulations, 
-                                                                                        max_workers=max_workers, 
-                                                                                        batch_size=batch_size,
-                                                                                        log_interval=log_interval)
+    results, total_shots, execution_time, aces, double_faults, backend = simulate_match_parallel(player1, 
+                                                                                                 player2, 
+                                                                                                 best_of=num_sets, 
+                                                                                                 grand_slam=True,
+                                                                                                 num_simulations=num_simulations, 
+                                                                                                 max_workers=max_workers, 
+                                                                                                 batch_size=batch_size,
+                                                                                                 log_interval=log_interval,
+                                                                                                 return_backend=True)
     
     print(f"Perc of Match wins after {num_simulations} matches:")
     for player, wins in results.items():
         print(f"{player}: {wins/num_simulations}")
     
     print(f"\nTotal shots played: {total_shots}")
-    print(f"Execution time: {execution_time:.2f} milliseconds")
+    print(f"Execution time: {execution_time:.2f} milliseconds ({backend} executor)")
     
     print("\nMatch statistics:")
     for player in [player1.name, player2.name]: